@@ -0,0 +1,43 @@
+#!/bin/bash
+
+# Systemd user unit for the collector, shared by install.sh, deploy.sh and the deploy workflow
+# Usage: source collector_service.sh && install_collector_service SERVICE_NAME APP_DIR
+
+install_collector_service() {
+    local service_name="$1"
+    local app_dir="$2"
+    local venv_dir="$app_dir/venv"
+    local unit_dir="$HOME/.config/systemd/user"
+
+    mkdir -p "$unit_dir"
+
+    # Remove the timer used by older installations; the collector now polls by itself
+    if [[ -f "$unit_dir/${service_name}.timer" ]]; then
+        systemctl --user disable --now "${service_name}.timer" 2>/dev/null || true
+        rm -f "$unit_dir/${service_name}.timer"
+        echo "Removed legacy ${service_name}.timer"
+    fi
+
+    # Always rewrite the unit, so older Type=oneshot units are replaced as well
+    cat > "$unit_dir/${service_name}.service" << UNIT
+[Unit]
+Description=Solar Inverter Data Collector
+After=network-online.target
+
+[Service]
+Type=simple
+WorkingDirectory=$app_dir
+Environment=PATH=$venv_dir/bin
+ExecStart=$venv_dir/bin/python collect_solar_data.py
+Restart=always
+RestartSec=30
+StandardOutput=journal
+StandardError=journal
+
+[Install]
+WantedBy=default.target
+UNIT
+
+    systemctl --user daemon-reload
+    systemctl --user enable "${service_name}.service"
+}
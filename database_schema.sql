@@ -49,7 +49,7 @@ CREATE TABLE inverter_data (
 
 CREATE TABLE collection_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
-    timestamp DATETIME NOT NULL,
+    timestamp DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
     status ENUM('success', 'error', 'warning') NOT NULL,
     message TEXT,
     execution_time_ms INT,
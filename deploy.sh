@@ -72,9 +72,14 @@ update_deployment() {
         exit 1
     fi
 
+    # Replace the unit (and any legacy timer) before stopping, so the old timer cannot start it again
+    print_status "Updating systemd service..."
+    source "$DEPLOY_DIR/collector_service.sh"
+    install_collector_service "$SERVICE_NAME" "$APP_DIR"
+
     # Stop the service during deployment
     print_status "Stopping service..."
-    systemctl --user stop ${SERVICE_NAME}.timer || true
+    systemctl --user stop ${SERVICE_NAME}.service || true
 
     # Backup current installation
     if [ -d "$APP_DIR" ]; then
@@ -87,6 +92,7 @@ update_deployment() {
 
     # Copy new files
     cp collect_solar_data.py "$APP_DIR/"
+    cp solar_common.py "$APP_DIR/"
     cp setup_database.py "$APP_DIR/"
     cp requirements.txt "$APP_DIR/"
     cp monitor.sh "$APP_DIR/"
@@ -97,26 +103,25 @@ update_deployment() {
     "$APP_DIR/venv/bin/pip" install --upgrade pip
     "$APP_DIR/venv/bin/pip" install -r "$APP_DIR/requirements.txt"
 
-    # Reload systemd and start service
+    # Start service
     print_status "Starting service..."
-    systemctl --user daemon-reload
-    systemctl --user start ${SERVICE_NAME}.timer
+    systemctl --user start ${SERVICE_NAME}.service
 
     # Verify deployment
     print_status "Verifying deployment..."
     sleep 5
 
-    if systemctl --user is-active --quiet ${SERVICE_NAME}.timer; then
+    if systemctl --user is-active --quiet ${SERVICE_NAME}.service; then
         print_success "Service is running"
     else
         print_error "Service failed to start"
-        systemctl --user status ${SERVICE_NAME}.timer --no-pager -l
+        systemctl --user status ${SERVICE_NAME}.service --no-pager -l
         exit 1
     fi
 
     # Test data collection
     print_status "Testing data collection..."
-    if timeout 30 "$APP_DIR/venv/bin/python" "$APP_DIR/collect_solar_data.py"; then
+    if timeout 30 "$APP_DIR/venv/bin/python" "$APP_DIR/collect_solar_data.py" --once; then
         print_success "Test collection successful"
     else
         print_warning "Test collection failed, but deployment completed"
@@ -128,7 +133,7 @@ update_deployment() {
 
     # Show status
     print_status "Service status:"
-    systemctl --user status ${SERVICE_NAME}.timer --no-pager -l
+    systemctl --user status ${SERVICE_NAME}.service --no-pager -l
 }
 
 rollback() {
@@ -145,7 +150,7 @@ rollback() {
     print_status "Rolling back to: $LATEST_BACKUP"
 
     # Stop service
-    systemctl --user stop ${SERVICE_NAME}.timer || true
+    systemctl --user stop ${SERVICE_NAME}.service || true
 
     # Backup current (failed) version
     mv "$APP_DIR" "${APP_DIR}.failed.$(date +%Y%m%d_%H%M%S)"
@@ -154,10 +159,10 @@ rollback() {
     mv "$LATEST_BACKUP" "$APP_DIR"
 
     # Start service
-    systemctl --user start ${SERVICE_NAME}.timer
+    systemctl --user start ${SERVICE_NAME}.service
 
     print_success "Rollback completed"
-    systemctl --user status ${SERVICE_NAME}.timer --no-pager -l
+    systemctl --user status ${SERVICE_NAME}.service --no-pager -l
 }
 
 show_help() {
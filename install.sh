@@ -5,6 +5,8 @@
 
 set -e
 
+source "$(dirname "$0")/collector_service.sh"
+
 # Colors for output
 RED='\033[0;31m'
 GREEN='\033[0;32m'
@@ -103,45 +105,9 @@ setup_python_environment() {
 setup_systemd_service() {
     print_status "Setting up systemd user service..."
 
-    # Create user systemd directory
-    mkdir -p "$HOME/.config/systemd/user"
-
-    cat > "$HOME/.config/systemd/user/${APP_NAME}.service" << EOF
-[Unit]
-Description=Solar Inverter Data Collector
-After=network.target
-
-[Service]
-Type=oneshot
-WorkingDirectory=$APP_DIR
-Environment=PATH=$VENV_DIR/bin
-ExecStart=$VENV_DIR/bin/python collect_solar_data.py
-StandardOutput=journal
-StandardError=journal
-
-[Install]
-WantedBy=default.target
-EOF
-
-    # Setup systemd timer for every minute execution
-    cat > "$HOME/.config/systemd/user/${APP_NAME}.timer" << EOF
-[Unit]
-Description=Run Solar Inverter Data Collector every minute
-Requires=${APP_NAME}.service
-
-[Timer]
-OnCalendar=*:*:00
-Persistent=true
-
-[Install]
-WantedBy=timers.target
-EOF
-
-    # Reload and enable user services
-    systemctl --user daemon-reload
-    systemctl --user enable ${APP_NAME}.timer
+    install_collector_service "$APP_NAME" "$APP_DIR"
 
-    print_success "Systemd user service and timer created"
+    print_success "Systemd user service created"
 }
 
 setup_logrotate() {
@@ -193,8 +159,8 @@ setup_database_config() {
 start_services() {
     print_status "Starting services..."
 
-    systemctl --user start ${APP_NAME}.timer
-    systemctl --user status ${APP_NAME}.timer --no-pager -l
+    systemctl --user start ${APP_NAME}.service
+    systemctl --user status ${APP_NAME}.service --no-pager -l
 
     print_success "Services started"
 }
@@ -205,14 +171,13 @@ show_status() {
     echo "  Service User: $SERVICE_USER"
     echo "  Virtual Environment: $VENV_DIR"
     echo "  Service Name: ${APP_NAME}.service"
-    echo "  Timer Name: ${APP_NAME}.timer"
     echo ""
     print_status "Useful commands:"
-    echo "  Check timer status: systemctl --user status ${APP_NAME}.timer"
+    echo "  Check service status: systemctl --user status ${APP_NAME}.service"
     echo "  Check service logs: journalctl --user -u ${APP_NAME}.service -f"
-    echo "  Run manual collection: $VENV_DIR/bin/python $APP_DIR/collect_solar_data.py"
-    echo "  Start timer: systemctl --user start ${APP_NAME}.timer"
-    echo "  Stop timer: systemctl --user stop ${APP_NAME}.timer"
+    echo "  Run manual collection: $VENV_DIR/bin/python $APP_DIR/collect_solar_data.py --once"
+    echo "  Start service: systemctl --user start ${APP_NAME}.service"
+    echo "  Stop service: systemctl --user stop ${APP_NAME}.service"
     echo "  Monitor script: $APP_DIR/monitor.sh status"
     echo ""
     print_success "Installation complete!"
@@ -32,8 +32,6 @@ print_error() {
 
 show_status() {
     print_status "Service Status:"
-    systemctl --user status ${APP_NAME}.timer --no-pager -l
-    echo ""
     systemctl --user status ${APP_NAME}.service --no-pager -l
 }
 
@@ -49,27 +47,26 @@ follow_logs() {
 
 test_connection() {
     print_status "Testing database connection and XML endpoint..."
-    "$APP_DIR/venv/bin/python" "$APP_DIR/collect_solar_data.py"
+    "$APP_DIR/venv/bin/python" "$APP_DIR/collect_solar_data.py" --once
 }
 
 start_service() {
     print_status "Starting service..."
-    systemctl --user start ${APP_NAME}.timer
+    systemctl --user start ${APP_NAME}.service
     print_success "Service started"
     show_status
 }
 
 stop_service() {
     print_status "Stopping service..."
-    systemctl --user stop ${APP_NAME}.timer
+    systemctl --user stop ${APP_NAME}.service
     print_success "Service stopped"
     show_status
 }
 
 restart_service() {
     print_status "Restarting service..."
-    systemctl --user stop ${APP_NAME}.timer
-    systemctl --user start ${APP_NAME}.timer
+    systemctl --user restart ${APP_NAME}.service
     print_success "Service restarted"
     show_status
 }
@@ -95,9 +92,8 @@ SELECT 'Latest Energy Today (kWh)', COALESCE(e_today, 0) FROM inverter_data ORDE
 UNION ALL
 SELECT 'Latest Total Energy (kWh)', COALESCE(e_total, 0) FROM inverter_data ORDER BY timestamp DESC LIMIT 1
 UNION ALL
-SELECT 'Success Rate Today (%)',
-       ROUND(100.0 * SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) / COUNT(*), 2)
-FROM collection_logs WHERE DATE(timestamp) = CURDATE();
+SELECT 'Errors Today', COUNT(*)
+FROM collection_logs WHERE DATE(timestamp) = CURDATE() AND status = 'error';
 EOF
         else
             print_warning "Database configuration not found in $APP_DIR/.env"
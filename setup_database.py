@@ -27,6 +27,7 @@ def get_db_config():
 def create_database_and_user(config):
     """Create database and user with proper permissions"""
     connection = None
+    cursor = None
     try:
         # Connect as root
         connection = mysql.connector.connect(
@@ -56,9 +57,17 @@ def create_database_and_user(config):
         print(f"Error creating database and user: {e}")
         return False
     finally:
-        if connection and connection.is_connected():
-            cursor.close()
-            connection.close()
+        # close() is safe on a dropped connection, so skip the is_connected() ping
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Error:
+                pass
+        if connection is not None:
+            try:
+                connection.close()
+            except Error:
+                pass
 
     return True
 
@@ -66,6 +75,7 @@ def create_database_and_user(config):
 def create_tables(config):
     """Create the required tables"""
     connection = None
+    cursor = None
     try:
         # Connect as application user
         connection = mysql.connector.connect(
@@ -130,7 +140,7 @@ def create_tables(config):
         cursor.execute("""
         CREATE TABLE IF NOT EXISTS collection_logs (
             id INT AUTO_INCREMENT PRIMARY KEY,
-            timestamp DATETIME NOT NULL,
+            timestamp DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
             status ENUM('success', 'error', 'warning') NOT NULL,
             message TEXT,
             execution_time_ms INT,
@@ -141,14 +151,21 @@ def create_tables(config):
         )
         """)
 
+        # Existing installations: the collectors no longer send a log timestamp
+        print("Updating collection_logs timestamp default...")
+        cursor.execute("""
+        ALTER TABLE collection_logs
+            MODIFY timestamp DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)
+        """)
+
         connection.commit()
         print("Tables created successfully!")
 
         # Insert test log entry
         print("Inserting test log entry...")
         cursor.execute("""
-        INSERT INTO collection_logs (timestamp, status, message, execution_time_ms)
-        VALUES (NOW(), 'success', 'Database setup completed', 0)
+        INSERT INTO collection_logs (status, message, execution_time_ms)
+        VALUES ('success', 'Database setup completed', 0)
         """)
         connection.commit()
 
@@ -158,9 +175,17 @@ def create_tables(config):
         print(f"Error creating tables: {e}")
         return False
     finally:
-        if connection and connection.is_connected():
-            cursor.close()
-            connection.close()
+        # close() is safe on a dropped connection, so skip the is_connected() ping
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Error:
+                pass
+        if connection is not None:
+            try:
+                connection.close()
+            except Error:
+                pass
 
     return True
 
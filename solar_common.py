@@ -0,0 +1,576 @@
+"""
+Shared code for the solar inverter and P1 meter collectors
+Configuration, logging, the HTTP session, the inverter field schema, P1 meter handling and database writes
+"""
+
+import os
+import time
+import queue
+import threading
+import logging
+import json
+import orjson
+from collections import deque
+from functools import lru_cache
+from operator import itemgetter
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple, Callable, Deque, Sequence
+import requests
+from requests.adapters import HTTPAdapter
+from mysql.connector import Error, InterfaceError, OperationalError, IntegrityError, DataError, pooling
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+# MySQL/MariaDB socket on Debian and Raspberry Pi OS, used when the database is on this host
+DEFAULT_DB_SOCKET = '/var/run/mysqld/mysqld.sock'
+
+# P1 meter unique_id -> p1_devices.id, so a running collector reads the device cache file only once
+KNOWN_DEVICE_IDS: Dict[str, int] = {}
+
+# Shared HTTP session so connections to the meter/inverter are kept alive and reused
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=2))
+
+
+# (JSON key, default) pairs for the p1_meter_data columns after device_id and timestamp, in insert order
+P1_FIELDS = (
+    ('wifi_strength', None),
+    ('active_tariff', None),
+    ('total_power_import_kwh', None),
+    ('total_power_import_t1_kwh', None),
+    ('total_power_import_t2_kwh', None),
+    ('total_power_export_kwh', None),
+    ('total_power_export_t1_kwh', None),
+    ('total_power_export_t2_kwh', None),
+    ('active_power_w', None),
+    ('active_power_l1_w', None),
+    ('active_power_l2_w', None),
+    ('active_power_l3_w', None),
+    ('active_voltage_l1_v', None),
+    ('active_voltage_l2_v', None),
+    ('active_voltage_l3_v', None),
+    ('active_current_a', None),
+    ('active_current_l1_a', None),
+    ('active_current_l2_a', None),
+    ('active_current_l3_a', None),
+    ('voltage_sag_l1_count', 0),
+    ('voltage_sag_l2_count', 0),
+    ('voltage_sag_l3_count', 0),
+    ('voltage_swell_l1_count', 0),
+    ('voltage_swell_l2_count', 0),
+    ('voltage_swell_l3_count', 0),
+    ('any_power_fail_count', 0),
+    ('long_power_fail_count', 0),
+)
+
+# Readings repeat a lot between polls ('-', '0', '49.99', ...), so remember parsed values
+@lru_cache(maxsize=1024)
+def parse_xml_value(value: str) -> Optional[float]:
+    """Parse XML value, handling '-' and other non-numeric text as None"""
+    if value is None:
+        return None
+    text = value.strip()
+    # Only hand things that look like numbers to float(), so '-' cells skip the exception path
+    if not text or text == '-' or not (text[0].isdigit() or text[0] in '+-.'):
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_int_or_zero(value: str) -> int:
+    """Parse an integer reading, storing 0 when it is missing"""
+    return int(parse_xml_value(value) or 0)
+
+
+def parse_optional_int(value: str) -> Optional[int]:
+    """Parse an integer reading, keeping None when it is missing"""
+    number = parse_xml_value(value)
+    return int(number) if number is not None else None
+
+
+def parse_text(value: str) -> Optional[str]:
+    """Keep a textual reading such as the inverter state as-is"""
+    return value
+
+
+# (data key, XML tag, parser) for every inverter field, in inverter_data column order
+SCHEMA = (
+    ('state', 'state', parse_text),
+    ('vac_l1', 'Vac_l1', parse_xml_value),
+    ('vac_l2', 'Vac_l2', parse_xml_value),
+    ('vac_l3', 'Vac_l3', parse_xml_value),
+    ('iac_l1', 'Iac_l1', parse_xml_value),
+    ('iac_l2', 'Iac_l2', parse_xml_value),
+    ('iac_l3', 'Iac_l3', parse_xml_value),
+    ('freq1', 'Freq1', parse_xml_value),
+    ('freq2', 'Freq2', parse_xml_value),
+    ('freq3', 'Freq3', parse_xml_value),
+    ('pac1', 'pac1', parse_int_or_zero),
+    ('pac2', 'pac2', parse_optional_int),
+    ('pac3', 'pac3', parse_optional_int),
+    ('p_ac', 'p-ac', parse_int_or_zero),
+    ('temp', 'temp', parse_xml_value),
+    ('e_today', 'e-today', parse_xml_value),
+    ('t_today', 't-today', parse_xml_value),
+    ('e_total', 'e-total', parse_xml_value),
+    ('co2', 'CO2', parse_xml_value),
+    ('t_total', 't-total', parse_xml_value),
+    ('v_pv1', 'v-pv1', parse_xml_value),
+    ('v_pv2', 'v-pv2', parse_xml_value),
+    ('v_pv3', 'v-pv3', parse_xml_value),
+    ('v_bus', 'v-bus', parse_xml_value),
+    ('max_power', 'maxPower', parse_int_or_zero),
+    ('i_pv11', 'i-pv11', parse_xml_value),
+    ('i_pv12', 'i-pv12', parse_xml_value),
+    ('i_pv13', 'i-pv13', parse_xml_value),
+    ('i_pv14', 'i-pv14', parse_xml_value),
+    ('i_pv21', 'i-pv21', parse_xml_value),
+    ('i_pv22', 'i-pv22', parse_xml_value),
+    ('i_pv23', 'i-pv23', parse_xml_value),
+    ('i_pv24', 'i-pv24', parse_xml_value),
+    ('i_pv31', 'i-pv31', parse_xml_value),
+    ('i_pv32', 'i-pv32', parse_xml_value),
+    ('i_pv33', 'i-pv33', parse_xml_value),
+    ('i_pv34', 'i-pv34', parse_xml_value),
+)
+
+# inverter_data columns in insert order, taken from SCHEMA; each is also the key of the parsed reading
+INVERTER_FIELDS = ('timestamp',) + tuple(key for key, _, _ in SCHEMA)
+
+# Picks the inverter_data values out of a parsed reading, in column order, in one call
+INVERTER_ROW_GETTER = itemgetter(*INVERTER_FIELDS)
+
+# INSERT statements for the buffered readings; positional placeholders so they can be prepared
+INVERTER_INSERT_QUERY = (
+    f"INSERT INTO inverter_data ({', '.join(INVERTER_FIELDS)}) "
+    f"VALUES ({', '.join(['%s'] * len(INVERTER_FIELDS))})"
+)
+
+P1_INSERT_QUERY = (
+    f"INSERT INTO p1_meter_data (device_id, timestamp, {', '.join(key for key, _ in P1_FIELDS)}) "
+    f"VALUES ({', '.join(['%s'] * (len(P1_FIELDS) + 2))})"
+)
+
+# collection_logs.timestamp is filled in by the server, which also works on tables without a column default
+LOG_INSERT_QUERY = """
+    INSERT INTO collection_logs (timestamp, status, message, execution_time_ms)
+    VALUES (NOW(3), %s, %s, %s)
+    """
+
+# Insert the device, or make LAST_INSERT_ID() return the existing row's id
+DEVICE_UPSERT_QUERY = """
+    INSERT INTO p1_devices (unique_id, meter_model, smr_version, wifi_ssid)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+    """
+
+
+# Resolved once at startup from the environment / .env and never changed afterwards
+@dataclass(frozen=True)
+class Config:
+    """Configuration class for database and endpoint settings"""
+    xml_endpoint: str = os.getenv('SOLAR_XML_ENDPOINT', 'http://192.168.1.50/real_time_data.xml')
+    p1_endpoint: str = os.getenv('P1_ENDPOINT', '')
+    db_host: str = os.getenv('DB_HOST', 'localhost')
+    db_user: str = os.getenv('DB_USER', 'solar_user')
+    db_password: str = os.getenv('DB_PASSWORD', '')
+    db_name: str = os.getenv('DB_NAME', 'solar_inverter')
+    db_socket: str = os.getenv('DB_SOCKET', '')
+    db_timeout: int = int(os.getenv('DB_TIMEOUT', '10'))
+    request_timeout: int = int(os.getenv('REQUEST_TIMEOUT', '10'))
+    poll_interval: int = int(os.getenv('POLL_INTERVAL', '60'))
+    batch_size: int = int(os.getenv('BATCH_SIZE', '1'))
+    flush_seconds: int = int(os.getenv('FLUSH_SECONDS', '300'))
+    buffer_max_rows: int = int(os.getenv('BUFFER_MAX_ROWS', '1440'))
+    device_cache_path: str = os.path.expanduser(os.getenv('P1_DEVICE_CACHE', '~/.cache/solar-inverter/p1_device.json'))
+    log_success_to_db: bool = os.getenv('LOG_SUCCESS_DB', '0') == '1'
+    log_level: str = os.getenv('LOG_LEVEL', 'INFO')
+
+
+@dataclass
+class WriteBuffer:
+    """Readings waiting to be written to the database in one batch"""
+    max_rows: int = 1440
+    inverter_rows: Deque[Tuple] = field(init=False)
+    p1_rows: Deque[Tuple] = field(init=False)
+    last_flush: float = field(default_factory=time.monotonic)
+    # Set when the last flush had its P1 rows rejected, e.g. for a stale cached device ID
+    p1_rejected: bool = False
+
+    def __post_init__(self):
+        # Ring buffers: while the database is unreachable the oldest readings are dropped first
+        self.inverter_rows = deque(maxlen=self.max_rows)
+        self.p1_rows = deque(maxlen=self.max_rows)
+
+    def is_due(self, batch_size: int, flush_seconds: int) -> bool:
+        """Return True once enough rows are buffered or they have waited long enough"""
+        pending = max(len(self.inverter_rows), len(self.p1_rows))
+        return pending > 0 and (pending >= batch_size or time.monotonic() - self.last_flush >= flush_seconds)
+
+
+@dataclass
+class Database:
+    """Pooled connection held across collection cycles, with its prepared INSERT cursors"""
+    pool: pooling.MySQLConnectionPool
+    connection: Optional[pooling.PooledMySQLConnection] = None
+    cursors: Dict[str, Any] = field(default_factory=dict)
+
+    def connect(self) -> pooling.PooledMySQLConnection:
+        """Return the held connection, checking one out of the pool if there is none"""
+        if self.connection is None:
+            self.connection = self.pool.get_connection()
+        return self.connection
+
+    def prepared(self, query: str):
+        """Return the prepared cursor for query; the statement is only parsed on first use"""
+        cursor = self.cursors.get(query)
+        if cursor is None:
+            cursor = self.connect().cursor(prepared=True)
+            self.cursors[query] = cursor
+        return cursor
+
+    def release(self):
+        """Roll back any open transaction, close the prepared cursors and hand the connection back to the pool"""
+        for cursor in self.cursors.values():
+            try:
+                cursor.close()
+            except Error:
+                pass
+        self.cursors.clear()
+        if self.connection is not None:
+            try:
+                self.connection.rollback()
+            except Error:
+                pass
+            try:
+                self.connection.close()
+            except Error:
+                pass
+            self.connection = None
+
+
+def setup_logging(log_level: str, name: str = 'solar_collector') -> logging.Logger:
+    """Setup logging configuration"""
+    logger = logging.getLogger(name)
+    logger.setLevel(getattr(logging, log_level.upper()))
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+    return logger
+
+
+def fetch_with_retry(fetch: Callable[[str, int, logging.Logger], Optional[Dict[str, Any]]], endpoint: str,
+                     timeout: int, logger: logging.Logger, tries: int = 3, base_delay: float = 0.25) -> Optional[Dict[str, Any]]:
+    """Call a fetch function until it returns data, waiting 0.25s, 1s, ... between failed attempts"""
+    for attempt in range(tries):
+        data = fetch(endpoint, timeout, logger)
+        if data is not None:
+            return data
+        if attempt < tries - 1:
+            delay = base_delay * 4 ** attempt
+            logger.warning(f"Retrying {endpoint} in {delay:g}s (attempt {attempt + 2} of {tries})")
+            time.sleep(delay)
+    return None
+
+
+def fetch_p1_data(endpoint: str, timeout: int, logger: logging.Logger) -> Optional[Dict[str, Any]]:
+    """Fetch and parse JSON data from P1 meter endpoint"""
+    if not endpoint:
+        logger.debug("P1 endpoint not configured, skipping P1 data collection")
+        return None
+
+    try:
+        logger.debug(f"Fetching P1 data from {endpoint}")
+        response = SESSION.get(endpoint, timeout=timeout)
+        response.raise_for_status()
+
+        data = orjson.loads(response.content)
+        data['timestamp'] = datetime.now()
+
+        logger.debug(f"Parsed P1 data: {data}")
+        return data
+
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to fetch P1 data from endpoint: {e}")
+        return None
+    except orjson.JSONDecodeError as e:
+        logger.error(f"Failed to parse P1 JSON: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error while fetching P1 data: {e}")
+        return None
+
+
+def create_connection_pool(config: Config, pool_name: str = 'solar') -> pooling.MySQLConnectionPool:
+    """Create the MySQL connection pool shared by all database helpers"""
+    # use_pure=False only pins the connector's default (since 8.0.11) of using its C extension when available.
+    # autocommit saves a separate COMMIT round-trip for the single-statement writes.
+    # connection_timeout bounds connecting to (and waiting on) an unreachable server, so a failed
+    # flush returns in seconds and the next poll still happens instead of waiting out the TCP timeout.
+    connect_args = dict(
+        host=config.db_host,
+        user=config.db_user,
+        password=config.db_password,
+        database=config.db_name,
+        use_pure=False,
+        autocommit=True,
+        connection_timeout=config.db_timeout
+    )
+
+    # A local server is reached over its UNIX socket instead of loopback TCP
+    socket_path = config.db_socket
+    if not socket_path and config.db_host in ('localhost', '127.0.0.1') and os.path.exists(DEFAULT_DB_SOCKET):
+        socket_path = DEFAULT_DB_SOCKET
+    if socket_path:
+        connect_args['unix_socket'] = socket_path
+
+    return pooling.MySQLConnectionPool(pool_name=pool_name, pool_size=2, **connect_args)
+
+
+def load_cached_device_id(cache_path: str, unique_id: str, logger: logging.Logger) -> Optional[int]:
+    """Return the cached device ID for this P1 meter, or None if not cached"""
+    device_id = KNOWN_DEVICE_IDS.get(unique_id)
+    if device_id is not None:
+        return device_id
+
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get('unique_id') == unique_id and cached.get('device_id') is not None:
+            KNOWN_DEVICE_IDS[unique_id] = cached['device_id']
+            return cached['device_id']
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"Ignoring unreadable P1 device cache {cache_path}: {e}")
+    return None
+
+
+def save_cached_device_id(cache_path: str, unique_id: str, device_id: int, logger: logging.Logger):
+    """Remember the device ID for this P1 meter so later runs can skip the device upsert"""
+    KNOWN_DEVICE_IDS[unique_id] = device_id
+    try:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump({'unique_id': unique_id, 'device_id': device_id}, f)
+    except OSError as e:
+        logger.warning(f"Failed to write P1 device cache {cache_path}: {e}")
+
+
+def clear_cached_device_id(cache_path: str, logger: logging.Logger):
+    """Remove a possibly stale device cache so the next run upserts the device again"""
+    KNOWN_DEVICE_IDS.clear()
+    try:
+        os.remove(cache_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to remove P1 device cache {cache_path}: {e}")
+
+
+def upsert_p1_device(data: Dict[str, Any], db: Database, logger: logging.Logger) -> Optional[int]:
+    """Register the P1 device, or look up the existing entry, and return its ID"""
+    cursor = None
+    try:
+        cursor = db.connect().cursor()
+
+        cursor.execute(DEVICE_UPSERT_QUERY, (
+            data['unique_id'],
+            data.get('meter_model'),
+            data.get('smr_version'),
+            data.get('wifi_ssid')
+        ))
+
+        device_id = cursor.lastrowid
+        # One affected row means the device was inserted; an existing device reports none
+        if cursor.rowcount == 1:
+            logger.info(f"Created new P1 device: {data.get('meter_model')} (ID: {device_id})")
+        else:
+            logger.debug(f"Using existing P1 device: {data.get('meter_model')} (ID: {device_id})")
+        return device_id
+
+    except Error as e:
+        logger.error(f"Database error while managing P1 device: {e}")
+        db.release()
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error while managing P1 device: {e}")
+        return None
+    finally:
+        if cursor is not None:
+            cursor.close()
+
+
+def build_inverter_row(data: Dict[str, Any]) -> Tuple:
+    """Build the inverter_data values for one inverter reading"""
+    return INVERTER_ROW_GETTER(data)
+
+
+def build_p1_row(data: Dict[str, Any], device_id: int) -> Tuple:
+    """Build the p1_meter_data values for one P1 reading"""
+    return (device_id, data['timestamp']) + tuple(data.get(key, default) for key, default in P1_FIELDS)
+
+
+def insert_rows(db: Database, query: str, rows: Sequence[Tuple]):
+    """Insert rows through the prepared statement, or as one multi-row INSERT for a larger batch"""
+    if len(rows) == 1:
+        db.prepared(query).execute(query, rows[0])
+        return
+
+    cursor = db.connect().cursor()
+    try:
+        # The C extension only accepts a list or tuple of rows, not the buffer's deque
+        cursor.executemany(query, list(rows))
+    finally:
+        cursor.close()
+
+
+def store_table_rows(db: Database, query: str, rows: Deque[Tuple], source: str, logger: logging.Logger) -> bool:
+    """Store one table's buffered rows, clearing them once written or rejected"""
+    try:
+        insert_rows(db, query, rows)
+        logger.debug(f"Stored {len(rows)} {source} rows")
+        rows.clear()
+        return True
+
+    except (InterfaceError, OperationalError) as e:
+        # Connection lost or server unavailable: keep the rows and retry on the next flush
+        logger.error(f"Database unavailable, keeping {len(rows)} {source} rows buffered: {e}")
+        db.release()
+        return False
+    except (IntegrityError, DataError) as e:
+        # The server rejected the rows themselves; retrying would fail the same way, so drop them
+        logger.error(f"Database rejected {len(rows)} {source} rows, dropping them: {e}")
+        rows.clear()
+        db.release()
+        return False
+    except Error as e:
+        # Anything else may pass (e.g. a table being restored); the ring buffer bounds what is kept
+        logger.error(f"Database error, keeping {len(rows)} {source} rows buffered: {e}")
+        db.release()
+        return False
+    except Exception as e:
+        logger.error(f"Unexpected error while storing {source} rows, keeping them buffered: {e}")
+        db.release()
+        return False
+
+
+def store_buffered_data(buffer: WriteBuffer, db: Database, logger: logging.Logger) -> bool:
+    """Store all buffered readings with one (multi-row) INSERT per table, in a single transaction when possible"""
+    buffer.p1_rejected = False
+    try:
+        # Writing both tables: one commit instead of two
+        if buffer.inverter_rows and buffer.p1_rows:
+            try:
+                db.connect().start_transaction()
+                insert_rows(db, INVERTER_INSERT_QUERY, buffer.inverter_rows)
+                insert_rows(db, P1_INSERT_QUERY, buffer.p1_rows)
+                db.connect().commit()
+
+                logger.debug(f"Stored {len(buffer.inverter_rows)} solar and {len(buffer.p1_rows)} P1 rows")
+                buffer.inverter_rows.clear()
+                buffer.p1_rows.clear()
+                return True
+
+            except (InterfaceError, OperationalError) as e:
+                # Connection lost or server unavailable: keep the rows and retry on the next flush
+                logger.error(f"Database unavailable, keeping {len(buffer.inverter_rows)} solar and "
+                             f"{len(buffer.p1_rows)} P1 rows buffered: {e}")
+                db.release()
+                return False
+            except Exception as e:
+                # Rows of one table may have been rejected; write each table on its own so only those are dropped
+                logger.warning(f"Failed to store solar and P1 rows together, storing them separately: {e}")
+                db.release()
+
+        solar_stored = True
+        if buffer.inverter_rows:
+            solar_stored = store_table_rows(db, INVERTER_INSERT_QUERY, buffer.inverter_rows, 'solar', logger)
+
+        p1_stored = True
+        if buffer.p1_rows:
+            p1_stored = store_table_rows(db, P1_INSERT_QUERY, buffer.p1_rows, 'P1', logger)
+            buffer.p1_rejected = not p1_stored and not buffer.p1_rows
+
+        return solar_stored and p1_stored
+
+    finally:
+        buffer.last_flush = time.monotonic()
+
+
+def flush_buffer(db: Database, buffer: WriteBuffer, logger: logging.Logger) -> bool:
+    """Store any readings that are still buffered, e.g. when the collector shuts down"""
+    if not buffer.inverter_rows and not buffer.p1_rows:
+        return True
+    return store_buffered_data(buffer, db, logger)
+
+
+def store_collection_logs(rows: Sequence[Tuple], db: Database, logger: logging.Logger):
+    """Log collection results to database"""
+    try:
+        # A plain cursor: the connection is handed back after each batch, so a prepared statement
+        # would be prepared and closed again for every (usually single) row
+        cursor = db.connect().cursor()
+        try:
+            cursor.executemany(LOG_INSERT_QUERY, list(rows))
+        finally:
+            cursor.close()
+    except Error as e:
+        logger.error(f"Failed to log collection result: {e}")
+        db.release()
+    except Exception as e:
+        logger.error(f"Unexpected error while logging collection result: {e}")
+        db.release()
+
+
+class LogWriter:
+    """Writes collection_logs rows on a background thread so collection cycles never wait for them"""
+
+    def __init__(self, pool: pooling.MySQLConnectionPool, logger: logging.Logger):
+        # Uses the pool's second connection; the collection cycle keeps the other one
+        self.db = Database(pool)
+        self.logger = logger
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, status: str, message: str, execution_time: int):
+        """Queue one collection result for the collection_logs table"""
+        self.queue.put((status, message, execution_time))
+
+    def run(self):
+        """Write queued results until close() is called, batching whatever has piled up"""
+        stopping = False
+        while not stopping:
+            rows = [self.queue.get()]
+            while True:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # None is the stop marker queued by close()
+            stopping = None in rows
+            rows = [row for row in rows if row is not None]
+            if rows:
+                store_collection_logs(rows, self.db, self.logger)
+                # Writes can be hours apart (often only failures are logged), longer than the server's
+                # wait_timeout; the pool checks the connection again when it is next handed out
+                self.db.release()
+
+    def close(self, timeout: float = 5.0):
+        """Write what is still queued, waiting at most timeout seconds, and stop the thread"""
+        self.queue.put(None)
+        self.thread.join(timeout)